@@ -21,7 +21,7 @@ print_usage() {
     echo "Usage: $0 [COMMAND] [OPTIONS]"
     echo ""
     echo "Commands:"
-    echo "  process <image>      - Run full pipeline on image"
+    echo "  process <image|dir>  - Run full pipeline on an image or a directory of images"
     echo "  assess <image>       - Assess image quality only"
     echo "  preprocess <image>   - Preprocess image only"
     echo "  detect <image>       - Run YOLO detection only"
@@ -33,6 +33,7 @@ print_usage() {
     echo "  -f, --filter FILTER  - Preprocessing filter (auto, blur, sharpen, denoise, clahe, edge)"
     echo "  -c, --confidence NUM - YOLO confidence threshold (0.0-1.0, default: 0.25)"
     echo "  -d, --device DEVICE  - Processing device (cpu, cuda, mps, default: cpu)"
+    echo "  -b, --batch-size NUM - YOLO batch size (default: 8 on cuda, 1 on cpu)"
     echo "  -o, --output DIR     - Output directory"
     echo "  -v, --verbose        - Verbose output"
     echo "  -h, --help           - Show this help"
@@ -164,6 +165,7 @@ run_command() {
     local device="cpu"
     local output=""
     local verbose=""
+    local batch=""
     
     while [[ $# -gt 0 ]]; do
         case $1 in
@@ -179,6 +181,10 @@ run_command() {
                 device="$2"
                 shift 2
                 ;;
+            -b|--batch-size)
+                batch="--batch-size $2"
+                shift 2
+                ;;
             -o|--output)
                 output="$2"
                 shift 2
@@ -194,8 +200,13 @@ run_command() {
         esac
     done
     
-    # Validate image path
-    if [ ! -f "$image" ]; then
+    # Validate image path (process and detect also accept a directory of images)
+    if [[ "$cmd" == "process" || "$cmd" == "detect" ]]; then
+        if [ ! -e "$image" ]; then
+            echo -e "${RED}Image file or directory not found: $image${NC}"
+            return 1
+        fi
+    elif [ ! -f "$image" ]; then
         echo -e "${RED}Image file not found: $image${NC}"
         return 1
     fi
@@ -213,7 +224,7 @@ run_command() {
     case "$cmd" in
         "process")
             echo -e "${BLUE}Running full pipeline on $image${NC}"
-            python3 python/pipeline.py "$image" -f "$filter" -c "$confidence" -d "$device" $verbose $([ -n "$output" ] && echo "-o $output")
+            python3 python/pipeline.py "$image" -f "$filter" -c "$confidence" -d "$device" $batch $verbose $([ -n "$output" ] && echo "-o $output")
             ;;
         "assess")
             echo -e "${BLUE}Assessing image quality: $image${NC}"
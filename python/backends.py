@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Inference backends for YOLOv5 detection
+Every backend takes a uint8 NCHW RGB batch and returns raw predictions as a
+torch tensor, so letterboxing and NMS stay the same whichever one is used.
+"""
+
+import ast
+import subprocess
+import sys
+from pathlib import Path
+import numpy as np
+
+try:
+    import torch
+    from yolov5.models.common import DetectMultiBackend
+except ImportError:
+    torch = None
+    DetectMultiBackend = None
+
+try:
+    import onnx
+except ImportError:
+    onnx = None
+
+try:
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+except ImportError:
+    ort = None
+    CalibrationDataReader = object
+    quantize_static = None
+
+try:
+    import tensorrt as trt
+except ImportError:
+    trt = None
+
+BACKENDS = ("auto", "torch", "onnx", "trt")
+
+# Weights whose ONNX export already failed in this process, so auto mode
+# does not respawn yolov5.export for every pipeline it constructs
+_failed_exports = set()
+
+
+class Backend:
+    """
+    Synchronous backends: submit runs inference immediately and result
+    returns it. Backends that can overlap work override both.
+    """
+
+    def submit(self, batch):
+        return self.infer(batch)
+
+    def result(self, handle):
+        return handle
+
+
+class TorchBackend(Backend):
+    """
+    Plain PyTorch inference through DetectMultiBackend. On CUDA, batches are
+    staged through double-buffered pinned host memory and copied on a side
+    stream, so the upload of batch N+1 overlaps the forward pass of batch N.
+    The fixed-shape forward pass is captured once per buffer as a CUDA graph
+    and replayed, removing per-kernel launch overhead.
+    """
+    name = "torch"
+
+    def __init__(self, weights, device, imgsz, batch_size=1, cuda_graph=True):
+        self.model = DetectMultiBackend(str(weights), device=torch.device(device))
+        self.device = self.model.device
+        self.stride = int(self.model.stride)
+        self.names = self.model.names
+        self.model.warmup(imgsz=(1, 3, *imgsz))
+
+        self.cuda = self.device.type == "cuda"
+        if self.cuda:
+            self._copy_stream = torch.cuda.Stream(self.device)
+            self._stream = torch.cuda.Stream(self.device)
+            self._copied = [torch.cuda.Event(), torch.cuda.Event()]
+            self._consumed = [torch.cuda.Event(), torch.cuda.Event()]
+            self._h = self._d = None
+            self._slot = 0
+            self._graphs = None
+            if cuda_graph:
+                self._warmup_cuda((batch_size, 3, *imgsz))
+
+    def _normalize(self, im):
+        im = im.half() if self.model.fp16 else im.float()
+        im /= 255
+        return im
+
+    def infer(self, batch):
+        with torch.no_grad():
+            return self.model(self._normalize(torch.from_numpy(batch).to(self.device)))
+
+    def _ensure_buffers(self, shape):
+        """
+        Pinned host and device input buffers, two of each. Staged as uint8 and
+        normalized on the GPU, which moves a quarter of the bytes of float32.
+        """
+        if self._h is None or self._h[0].shape[0] < shape[0] or self._h[0].shape[1:] != shape[1:]:
+            torch.cuda.synchronize(self.device)
+            self._h = [torch.empty(shape, dtype=torch.uint8).pin_memory() for _ in range(2)]
+            self._d = [torch.zeros(shape, dtype=torch.uint8, device=self.device) for _ in range(2)]
+            # Graphs are bound to the old buffer addresses
+            self._graphs = None
+
+    def _warmup_cuda(self, shape):
+        """
+        Warm up on a side stream, then capture one CUDA graph per device buffer
+        """
+        self._ensure_buffers(shape)
+        try:
+            s = torch.cuda.Stream(self.device)
+            s.wait_stream(torch.cuda.current_stream(self.device))
+            with torch.no_grad():
+                with torch.cuda.stream(s):
+                    for _ in range(3):
+                        self.model(self._normalize(self._d[0]))
+                torch.cuda.current_stream(self.device).wait_stream(s)
+
+                graphs, outputs = [], []
+                for d in self._d:
+                    graph = torch.cuda.CUDAGraph()
+                    with torch.cuda.graph(graph):
+                        out = self.model(self._normalize(d))
+                    graphs.append(graph)
+                    outputs.append(out[0] if isinstance(out, (list, tuple)) else out)
+            self._graphs, self._out = graphs, outputs
+        except Exception as e:
+            print(f"Warning: CUDA graph capture failed ({e}), running eagerly")
+            self._graphs = None
+
+    def submit(self, batch):
+        if not self.cuda:
+            return self.infer(batch)
+
+        n = len(batch)
+        self._ensure_buffers(batch.shape)
+        k = self._slot
+        self._slot ^= 1
+        h, d = self._h[k][:n], self._d[k][:n]
+
+        # The previous upload from this pinned buffer must be done before refilling it
+        self._copied[k].synchronize()
+        h.numpy()[...] = batch
+
+        with torch.cuda.stream(self._copy_stream):
+            # ...and the previous forward pass must have read this device buffer
+            self._copy_stream.wait_event(self._consumed[k])
+            d.copy_(h, non_blocking=True)
+            self._copied[k].record(self._copy_stream)
+
+        # Captured before switching streams: inside the context below,
+        # current_stream() is self._stream itself
+        caller = torch.cuda.current_stream(self.device)
+
+        with torch.no_grad(), torch.cuda.stream(self._stream):
+            self._stream.wait_event(self._copied[k])
+            if self._graphs is not None:
+                # Work still queued on the caller's stream (NMS) may read this
+                # slot's static output, so let it drain before replaying
+                self._stream.wait_stream(caller)
+                self._graphs[k].replay()
+                self._consumed[k].record(self._stream)
+                pred = self._out[k][:n]
+            else:
+                im = self._normalize(d)
+                self._consumed[k].record(self._stream)
+                pred = self.model(im)
+                pred = pred[0] if isinstance(pred, (list, tuple)) else pred
+            done = torch.cuda.Event()
+            done.record(self._stream)
+
+        return pred, done, self._graphs is None
+
+    def result(self, handle):
+        if not self.cuda:
+            return handle
+
+        # Synchronize only here, right before NMS
+        pred, done, eager = handle
+        done.synchronize()
+        if eager:
+            # Allocated on the compute stream but consumed on the caller's
+            pred.record_stream(torch.cuda.current_stream(self.device))
+        return pred
+
+
+class OnnxBackend(Backend):
+    """
+    ONNX Runtime inference, preferring the OpenVINO execution provider on CPU
+    """
+    name = "onnx"
+    providers = ["OpenVINOExecutionProvider", "CPUExecutionProvider"]
+
+    def __init__(self, onnx_path):
+        available = ort.get_available_providers()
+        providers = [p for p in self.providers if p in available]
+        self.session = ort.InferenceSession(str(onnx_path), providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.stride, self.names = _parse_metadata(self.session.get_modelmeta().custom_metadata_map)
+
+    def infer(self, batch):
+        im = batch.astype(np.float32)
+        im *= 1 / 255
+        pred = self.session.run(None, {self.input_name: im})[0]
+        return torch.from_numpy(pred)
+
+
+class TensorRTBackend(Backend):
+    """
+    TensorRT engine inference on CUDA devices
+    """
+    name = "trt"
+
+    def __init__(self, engine_path, device, stride, names):
+        logger = trt.Logger(trt.Logger.WARNING)
+        with open(engine_path, "rb") as f, trt.Runtime(logger) as runtime:
+            self.engine = runtime.deserialize_cuda_engine(f.read())
+        self.context = self.engine.create_execution_context()
+        self.device = torch.device(device)
+        self.stride, self.names = stride, names
+
+        tensor_names = [self.engine.get_tensor_name(i) for i in range(self.engine.num_io_tensors)]
+        self.input_name = next(n for n in tensor_names
+                               if self.engine.get_tensor_mode(n) == trt.TensorIOMode.INPUT)
+        self.output_name = next(n for n in tensor_names
+                                if self.engine.get_tensor_mode(n) == trt.TensorIOMode.OUTPUT)
+
+    def infer(self, batch):
+        im = torch.from_numpy(batch).to(self.device).float()
+        im /= 255
+
+        self.context.set_input_shape(self.input_name, tuple(im.shape))
+        out = torch.empty(tuple(self.context.get_tensor_shape(self.output_name)),
+                          dtype=torch.float32, device=self.device)
+        self.context.set_tensor_address(self.input_name, im.data_ptr())
+        self.context.set_tensor_address(self.output_name, out.data_ptr())
+        self.context.execute_async_v3(torch.cuda.current_stream(self.device).cuda_stream)
+        return out
+
+
+class _CalibrationReader(CalibrationDataReader):
+    """
+    Feeds letterboxed calibration images to onnxruntime's static quantizer
+    """
+
+    def __init__(self, input_name, images, preprocess):
+        self.input_name = input_name
+        self.images = iter(images)
+        self.preprocess = preprocess
+
+    def get_next(self):
+        for image in self.images:
+            blob = self.preprocess(image)
+            if blob is not None:
+                return {self.input_name: blob}
+        return None
+
+
+def _parse_metadata(metadata):
+    """
+    Read stride and class names stored by yolov5.export in ONNX metadata
+    """
+    stride = int(metadata.get("stride", 32))
+    names = ast.literal_eval(metadata["names"]) if "names" in metadata else {}
+    return stride, names
+
+
+def _onnx_metadata(onnx_path):
+    """
+    Metadata of an ONNX model read from the graph proto alone, without
+    building an inference session or loading external weights
+    """
+    if onnx is not None:
+        model = onnx.load(str(onnx_path), load_external_data=False)
+        return {p.key: p.value for p in model.metadata_props}
+    if ort is not None:
+        session = ort.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"])
+        return session.get_modelmeta().custom_metadata_map
+    return {}
+
+
+def export_onnx(weights, imgsz):
+    """
+    Export the PyTorch weights to ONNX with a dynamic batch axis (cached)
+    """
+    onnx_path = Path(weights).with_suffix(".onnx")
+    if not onnx_path.exists():
+        if onnx_path in _failed_exports:
+            raise RuntimeError(f"ONNX export of {weights} failed earlier")
+        print(f"Exporting {weights} to ONNX (one-time)...")
+        try:
+            subprocess.run([
+                sys.executable, "-m", "yolov5.export",
+                "--weights", str(weights),
+                "--imgsz", str(imgsz[0]), str(imgsz[1]),
+                "--include", "onnx",
+                "--dynamic"
+            ], check=True)
+        except subprocess.CalledProcessError:
+            _failed_exports.add(onnx_path)
+            raise
+    return onnx_path
+
+
+def quantize_onnx(onnx_path, calib_images, preprocess):
+    """
+    Post-training static INT8 quantization of the ONNX export (cached).
+    Weights are symmetric per-channel int8 and activations uint8 in QDQ
+    format, which ONNX Runtime maps onto VNNI int8 dot products on x86.
+    Only Conv/MatMul are quantized: the Detect head concatenates pixel-scale
+    boxes (0-640) with 0-1 confidences, and a single uint8 scale for that
+    Concat rounds every confidence to 0.
+    preprocess(image) must return a float32 1x3xHxW blob or None.
+    """
+    onnx_path = Path(onnx_path)
+    int8_path = onnx_path.with_name(f"{onnx_path.stem}-int8.onnx")
+    if not int8_path.exists():
+        if not calib_images:
+            raise ValueError("no calibration images available")
+        print(f"Quantizing {onnx_path} to INT8 with {len(calib_images)} calibration image(s) (one-time)...")
+        session = ort.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"])
+        quantize_static(
+            model_input=str(onnx_path),
+            model_output=str(int8_path),
+            calibration_data_reader=_CalibrationReader(session.get_inputs()[0].name, calib_images, preprocess),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            op_types_to_quantize=["Conv", "MatMul"]
+        )
+    return int8_path
+
+
+def build_trt_engine(onnx_path, imgsz, max_batch=32, fp16=True):
+    """
+    Build a TensorRT engine from the ONNX export with trtexec (cached)
+    """
+    engine_path = Path(onnx_path).with_suffix(".engine")
+    if not engine_path.exists():
+        print(f"Building TensorRT engine from {onnx_path} (one-time)...")
+        shape = f"3x{imgsz[0]}x{imgsz[1]}"
+        cmd = [
+            "trtexec",
+            f"--onnx={onnx_path}",
+            f"--saveEngine={engine_path}",
+            f"--minShapes=images:1x{shape}",
+            f"--optShapes=images:8x{shape}",
+            f"--maxShapes=images:{max_batch}x{shape}"
+        ]
+        if fp16:
+            cmd.append("--fp16")
+        subprocess.run(cmd, check=True, capture_output=True)
+    return engine_path
+
+
+def select_backend(device, weights=None):
+    """
+    TensorRT on CUDA and ONNX Runtime on CPU when installed, PyTorch otherwise.
+    Both need the ONNX export, so they are only chosen when it already exists
+    next to the weights or the onnx package is there to produce it.
+    """
+    exportable = onnx is not None or (
+        weights is not None and Path(weights).with_suffix(".onnx").exists())
+    if not exportable:
+        return "torch"
+    if str(device).startswith("cuda"):
+        return "trt" if trt is not None else "torch"
+    if str(device) == "cpu" and ort is not None:
+        return "onnx"
+    return "torch"
+
+
+def load_backend(backend, weights, device, imgsz, batch_size=1, int8=False, calib_images=(),
+                 preprocess=None):
+    """
+    Create the requested inference backend. In auto mode a backend that fails
+    to export or load falls back to PyTorch. With int8, the ONNX backend runs
+    a statically quantized model calibrated on calib_images.
+    """
+    if DetectMultiBackend is None:
+        return None
+
+    name = select_backend(device, weights) if backend == "auto" else backend
+
+    try:
+        if name == "torch":
+            return TorchBackend(weights, device, imgsz, batch_size)
+
+        onnx_path = export_onnx(weights, imgsz)
+        if name == "onnx":
+            if int8:
+                try:
+                    onnx_path = quantize_onnx(onnx_path, calib_images, preprocess)
+                    print(f"Using INT8 ONNX model {onnx_path.name}")
+                except Exception as e:
+                    print(f"Warning: INT8 quantization skipped ({e}), using FP32 ONNX model")
+            return OnnxBackend(onnx_path)
+        if name == "trt":
+            stride, names = _parse_metadata(_onnx_metadata(onnx_path))
+            return TensorRTBackend(build_trt_engine(onnx_path, imgsz), device, stride, names)
+
+        raise ValueError(f"Unknown backend: {name}")
+
+    except Exception as e:
+        if backend != "auto" or name == "torch":
+            raise
+        print(f"Warning: {name} backend unavailable ({e}), falling back to torch")
+        return TorchBackend(weights, device, imgsz, batch_size)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Numba kernel for image quality statistics
+image_stats is None when numba is not installed so callers can fall back to OpenCV.
+"""
+
+import numpy as np
+
+try:
+    import numba
+    from numba import prange
+except ImportError:
+    numba = None
+
+if numba is not None:
+    # image_stats also runs on executor threads (single-image runs assess in the
+    # event loop's default executor); TBB hangs at interpreter exit once a
+    # parallel region has started off the main thread
+    numba.config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+
+image_stats = None
+
+
+def set_num_threads(n):
+    """
+    Limit the parallel kernels to n threads (no-op without numba)
+    """
+    if numba is not None:
+        numba.set_num_threads(n)
+
+# Rows handled per parallel task; each task keeps its own rolling column sums
+_STATS_BLOCK_ROWS = 64
+
+if numba is not None:
+
+    @numba.njit(cache=True, parallel=True, fastmath=True)
+    def _image_stats(gray):
+        """
+        Single sweep over a uint8 image accumulating, in int64:
+          - sum / sum of squares of the pixels (brightness, contrast)
+          - sum / sum of squares of the 5-point Laplacian (blur variance)
+          - sum / sum of squares of |25*g - box5x5(g)| (noise proxy), where the
+            5x5 box sum is kept as rolling column sums updated with one add and
+            one subtract per pixel
+        """
+        h, w = gray.shape
+        n_blocks = (h + _STATS_BLOCK_ROWS - 1) // _STATS_BLOCK_ROWS
+        # Per-block partial sums, combined serially at the end
+        partial = np.zeros((n_blocks, 6), np.int64)
+
+        for b in prange(n_blocks):
+            r0 = b * _STATS_BLOCK_ROWS
+            r1 = min(r0 + _STATS_BLOCK_ROWS, h)
+            col = np.zeros(w, np.int64)
+            have_col = False
+            b_s_g = 0
+            b_ss_g = 0
+            b_s_l = 0
+            b_ss_l = 0
+            b_s_n = 0
+            b_ss_n = 0
+
+            for i in range(r0, r1):
+                for j in range(w):
+                    v = np.int64(gray[i, j])
+                    b_s_g += v
+                    b_ss_g += v * v
+
+                if 1 <= i < h - 1:
+                    for j in range(1, w - 1):
+                        v = (np.int64(gray[i - 1, j]) + np.int64(gray[i + 1, j]) +
+                             np.int64(gray[i, j - 1]) + np.int64(gray[i, j + 1]) -
+                             4 * np.int64(gray[i, j]))
+                        b_s_l += v
+                        b_ss_l += v * v
+
+                if 2 <= i < h - 2 and w > 4:
+                    if not have_col:
+                        for j in range(w):
+                            col[j] = (np.int64(gray[i - 2, j]) + np.int64(gray[i - 1, j]) +
+                                      np.int64(gray[i, j]) + np.int64(gray[i + 1, j]) +
+                                      np.int64(gray[i + 2, j]))
+                        have_col = True
+                    else:
+                        for j in range(w):
+                            col[j] += np.int64(gray[i + 2, j]) - np.int64(gray[i - 3, j])
+
+                    box = col[0] + col[1] + col[2] + col[3] + col[4]
+                    for j in range(2, w - 2):
+                        if j > 2:
+                            box += col[j + 2] - col[j - 3]
+                        d = abs(25 * np.int64(gray[i, j]) - box)
+                        b_s_n += d
+                        b_ss_n += d * d
+
+            partial[b, 0] = b_s_g
+            partial[b, 1] = b_ss_g
+            partial[b, 2] = b_s_l
+            partial[b, 3] = b_ss_l
+            partial[b, 4] = b_s_n
+            partial[b, 5] = b_ss_n
+
+        s_g, ss_g, s_l, ss_l, s_n, ss_n = partial.sum(axis=0)
+        return (s_g, ss_g, h * w,
+                s_l, ss_l, max(h - 2, 0) * max(w - 2, 0),
+                s_n, ss_n, max(h - 4, 0) * max(w - 4, 0))
+
+    def image_stats(gray):
+        """
+        Brightness, contrast, blur variance and noise level of a grayscale
+        image computed in one pass
+        """
+        s_g, ss_g, n_g, s_l, ss_l, n_l, s_n, ss_n, n_n = _image_stats(np.ascontiguousarray(gray))
+
+        def mean_var(s, ss, n):
+            n = max(n, 1)
+            mean = s / n
+            return mean, max(ss / n - mean * mean, 0.0)
+
+        brightness, contrast_var = mean_var(s_g, ss_g, n_g)
+        _, laplacian_var = mean_var(s_l, ss_l, n_l)
+        _, noise_var = mean_var(s_n, ss_n, n_n)
+
+        return {
+            'brightness': brightness,
+            'contrast': contrast_var ** 0.5,
+            'blur_variance': laplacian_var,
+            'noise_level': noise_var ** 0.5 / 25
+        }
+
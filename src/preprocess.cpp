@@ -1,12 +1,20 @@
 #include <opencv2/opencv.hpp>
 #include <opencv2/imgproc.hpp>
 #include <omp.h>
+#include <cstdint>
+#include <cstdlib>
+#include <cstdio>
 #include <iostream>
 #include <string>
 #include <vector>
 #include <chrono>
 #include <algorithm>
 #include <iomanip>
+#include <sstream>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
 
 enum class FilterType {
     GAUSSIAN_BLUR,
@@ -20,9 +28,10 @@ enum class FilterType {
 class ImagePreprocessor {
 private:
     bool verbose;
+    std::ostream& log;
     
 public:
-    ImagePreprocessor(bool verbose = true) : verbose(verbose) {}
+    ImagePreprocessor(bool verbose = true, std::ostream& log = std::cout) : verbose(verbose), log(log) {}
     
     /**
      * Apply Gaussian Blur in parallel
@@ -35,7 +44,7 @@ public:
             cv::GaussianBlur(img.row(r), result.row(r), kernelSize, sigma, sigma);
         }
         
-        if (verbose) std::cout << "Applied Gaussian Blur (parallel)\n";
+        if (verbose) log << "Applied Gaussian Blur (parallel)\n";
         return result;
     }
     
@@ -75,7 +84,7 @@ public:
         cv::Mat finalResult;
         result.convertTo(finalResult, CV_8U);
         
-        if (verbose) std::cout << "Applied Unsharp Mask sharpening (parallel)\n";
+        if (verbose) log << "Applied Unsharp Mask sharpening (parallel)\n";
         return finalResult;
     }
     
@@ -111,7 +120,7 @@ public:
             }
         }
         
-        if (verbose) std::cout << "Applied Laplacian sharpening (parallel)\n";
+        if (verbose) log << "Applied Laplacian sharpening (parallel)\n";
         return result;
     }
     
@@ -133,7 +142,7 @@ public:
         
         cv::merge(filteredChannels, result);
         
-        if (verbose) std::cout << "Applied Bilateral denoising (parallel)\n";
+        if (verbose) log << "Applied Bilateral denoising (parallel)\n";
         return result;
     }
     
@@ -159,7 +168,7 @@ public:
         // Merge channels back
         cv::merge(processedChannels, result);
         
-        if (verbose) std::cout << "Applied CLAHE enhancement\n";
+        if (verbose) log << "Applied CLAHE enhancement\n";
         return result;
     }
     
@@ -194,7 +203,7 @@ public:
             }
         }
         
-        if (verbose) std::cout << "Applied edge enhancement (parallel)\n";
+        if (verbose) log << "Applied edge enhancement (parallel)\n";
         return result;
     }
     
@@ -206,8 +215,9 @@ public:
         cv::cvtColor(img, gray, cv::COLOR_BGR2GRAY);
         
         // Calculate Laplacian variance (measure of blurriness)
+        // The 5-point stencil on 8-bit input fits in CV_16S, a quarter of CV_64F's traffic
         cv::Mat laplacian;
-        cv::Laplacian(gray, laplacian, CV_64F);
+        cv::Laplacian(gray, laplacian, CV_16S);
         cv::Scalar mean, stddev;
         cv::meanStdDev(laplacian, mean, stddev);
         double variance = stddev.val[0] * stddev.val[0];
@@ -231,24 +241,24 @@ public:
         double noiseLevel = noiseStd.val[0];
         
         if (verbose) {
-            std::cout << "Image Quality Assessment:\n";
-            std::cout << "  Blur variance: " << std::fixed << std::setprecision(1) << variance << " (>100 = sharp, <100 = blurry)\n";
-            std::cout << "  Brightness: " << std::fixed << std::setprecision(1) << brightness << " (0-255)\n";
-            std::cout << "  Noise level: " << std::fixed << std::setprecision(1) << noiseLevel << "\n";
+            log << "Image Quality Assessment:\n";
+            log << "  Blur variance: " << std::fixed << std::setprecision(1) << variance << " (>100 = sharp, <100 = blurry)\n";
+            log << "  Brightness: " << std::fixed << std::setprecision(1) << brightness << " (0-255)\n";
+            log << "  Noise level: " << std::fixed << std::setprecision(1) << noiseLevel << "\n";
         }
         
         // Decision logic
         if (variance < 100) {
-            std::cout << "  Recommendation: Image appears blurry - applying sharpening\n";
+            log << "  Recommendation: Image appears blurry - applying sharpening\n";
             return FilterType::UNSHARP_MASK;
         } else if (noiseLevel > 15) {
-            std::cout << "  Recommendation: Image appears noisy - applying denoising\n";
+            log << "  Recommendation: Image appears noisy - applying denoising\n";
             return FilterType::BILATERAL_DENOISE;
         } else if (brightness < 50 || brightness > 200) {
-            std::cout << "  Recommendation: Poor contrast - applying CLAHE\n";
+            log << "  Recommendation: Poor contrast - applying CLAHE\n";
             return FilterType::CLAHE_ENHANCE;
         } else {
-            std::cout << "  Recommendation: Good quality - applying edge enhancement\n";
+            log << "  Recommendation: Good quality - applying edge enhancement\n";
             return FilterType::EDGE_ENHANCE;
         }
     }
@@ -276,17 +286,186 @@ public:
     }
 };
 
+/**
+ * Write an image to stdout as a uint32 width,height header followed by raw BGR bytes
+ */
+bool writeRaw(const cv::Mat& img) {
+    cv::Mat bgr = img.isContinuous() ? img : img.clone();
+    uint32_t header[2] = {static_cast<uint32_t>(bgr.cols), static_cast<uint32_t>(bgr.rows)};
+    
+    size_t bytes = bgr.total() * bgr.elemSize();
+    bool ok = std::fwrite(header, sizeof(header), 1, stdout) == 1 &&
+              std::fwrite(bgr.data, 1, bytes, stdout) == bytes;
+    return std::fflush(stdout) == 0 && ok;
+}
+
+/**
+ * Map a filter name to its FilterType (unknown names fall back to blur)
+ */
+FilterType parseFilter(const std::string& filterStr) {
+    if (filterStr == "sharpen") return FilterType::UNSHARP_MASK;
+    if (filterStr == "laplacian") return FilterType::LAPLACIAN_SHARPEN;
+    if (filterStr == "denoise") return FilterType::BILATERAL_DENOISE;
+    if (filterStr == "clahe") return FilterType::CLAHE_ENHANCE;
+    if (filterStr == "edge") return FilterType::EDGE_ENHANCE;
+    return FilterType::GAUSSIAN_BLUR;
+}
+
+/**
+ * BGR frame in a POSIX shared memory region created by the caller, mapped from
+ * a "shm:<name>:<width>:<height>" request field and unmapped on destruction
+ */
+class SharedFrame {
+private:
+    void* addr = MAP_FAILED;
+    size_t bytes = 0;
+    
+public:
+    cv::Mat mat;
+    
+    ~SharedFrame() {
+        if (addr != MAP_FAILED) munmap(addr, bytes);
+    }
+    
+    bool map(const std::string& spec) {
+        std::vector<std::string> parts;
+        std::stringstream ss(spec);
+        std::string part;
+        while (std::getline(ss, part, ':')) parts.push_back(part);
+        if (parts.size() != 4 || parts[0] != "shm") return false;
+        
+        int width = std::atoi(parts[2].c_str());
+        int height = std::atoi(parts[3].c_str());
+        if (width <= 0 || height <= 0) return false;
+        
+        int fd = shm_open(("/" + parts[1]).c_str(), O_RDWR, 0);
+        if (fd < 0) return false;
+        // Touching pages past the end of the region would raise SIGBUS
+        struct stat st;
+        size_t needed = static_cast<size_t>(width) * height * 3;
+        if (fstat(fd, &st) != 0 || static_cast<size_t>(st.st_size) < needed) {
+            close(fd);
+            return false;
+        }
+        bytes = needed;
+        addr = mmap(nullptr, bytes, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+        close(fd);
+        if (addr == MAP_FAILED) return false;
+        
+        mat = cv::Mat(height, width, CV_8UC3, addr);
+        return true;
+    }
+};
+
+/**
+ * Reply "ERR <message>" on a single line (OpenCV messages span several)
+ */
+void replyError(std::string message) {
+    std::replace(message.begin(), message.end(), '\n', ' ');
+    std::cout << "ERR " << message << std::endl;
+}
+
+/**
+ * Long-lived worker: one request per stdin line, "input<TAB>output<TAB>filter"
+ * with an optional "<TAB>verbose" that logs the assessment and filter to stderr.
+ * Replies "OK" (followed by a raw frame when output is "-") or "ERR <message>",
+ * so callers pay process start-up and OpenCV initialization only once.
+ * An input of "shm:<name>:<width>:<height>" reads already decoded pixels from
+ * shared memory, and an output of "shm" writes the result back into it.
+ */
+int runDaemon() {
+    // Discards everything written to it
+    std::ostream quiet(nullptr);
+    std::string line;
+    
+    while (std::getline(std::cin, line)) {
+        if (line.empty()) continue;
+        
+        std::vector<std::string> fields;
+        std::stringstream ss(line);
+        std::string field;
+        while (std::getline(ss, field, '\t')) fields.push_back(field);
+        
+        if (fields.size() != 3 && !(fields.size() == 4 && fields[3] == "verbose")) {
+            std::cout << "ERR Expected input<TAB>output<TAB>filter[<TAB>verbose]" << std::endl;
+            continue;
+        }
+        
+        bool verbose = fields.size() == 4;
+        ImagePreprocessor processor(verbose, verbose ? std::cerr : quiet);
+        const std::string& in = fields[0];
+        const std::string& out = fields[1];
+        
+        // A corrupt image or failed filter must not take the worker down
+        try {
+            SharedFrame shared;
+            cv::Mat img;
+            if (in.rfind("shm:", 0) == 0) {
+                if (shared.map(in)) img = shared.mat;
+            } else {
+                img = cv::imread(in, cv::IMREAD_COLOR);
+            }
+            if (img.empty()) {
+                std::cout << "ERR Failed to open " << in << std::endl;
+                continue;
+            }
+            
+            FilterType filter = (fields[2] == "auto") ? processor.assessImageQuality(img) : parseFilter(fields[2]);
+            cv::Mat processed = processor.processImage(img, filter);
+            
+            if (out == "shm") {
+                if (shared.mat.empty() || processed.size() != img.size() || processed.type() != img.type()) {
+                    std::cout << "ERR Cannot write result to shared memory" << std::endl;
+                    continue;
+                }
+                processed.copyTo(shared.mat);
+                std::cout << "OK" << std::endl;
+            } else if (out == "-") {
+                std::cout << "OK" << std::endl;
+                if (!writeRaw(processed)) return 1;
+            } else if (cv::imwrite(out, processed)) {
+                std::cout << "OK" << std::endl;
+            } else {
+                std::cout << "ERR Failed to save " << out << std::endl;
+            }
+        } catch (const cv::Exception& e) {
+            replyError(e.what());
+        } catch (const std::exception& e) {
+            replyError(e.what());
+        }
+    }
+    
+    return 0;
+}
+
 int main(int argc, char** argv) {
-    if (argc < 3) {
-        std::cerr << "Usage: " << argv[0] << " <input_img> <output_img> [filter_type] [auto_assess]\n";
+    // --raw streams the result to stdout instead of encoding it to output_img
+    bool raw = false;
+    std::vector<std::string> args;
+    for (int i = 1; i < argc; ++i) {
+        std::string arg = argv[i];
+        if (arg == "--raw") raw = true;
+        else if (arg == "--daemon") return runDaemon();
+        else args.push_back(arg);
+    }
+    
+    if (args.size() < 2) {
+        std::cerr << "Usage: " << argv[0] << " <input_img> <output_img> [filter_type] [auto_assess] [--raw]\n";
+        std::cerr << "       " << argv[0] << " --daemon\n";
         std::cerr << "Filter types: blur, sharpen, laplacian, denoise, clahe, edge\n";
         std::cerr << "Auto assess: use 'auto' to automatically choose best filter\n";
+        std::cerr << "--raw: write width,height (uint32) + raw BGR bytes to stdout; output_img is ignored\n";
+        std::cerr << "--daemon: read input<TAB>output<TAB>filter[<TAB>verbose] lines from stdin, reply OK/ERR per line\n";
+        std::cerr << "          (input shm:<name>:<w>:<h> / output shm use a shared memory BGR frame)\n";
         return 1;
     }
     
-    std::string in = argv[1], out = argv[2];
-    std::string filterStr = (argc > 3) ? argv[3] : "auto";
-    bool autoAssess = (filterStr == "auto") || (argc > 4 && std::string(argv[4]) == "auto");
+    std::string in = args[0], out = args[1];
+    std::string filterStr = (args.size() > 2) ? args[2] : "auto";
+    bool autoAssess = (filterStr == "auto") || (args.size() > 3 && args[3] == "auto");
+    
+    // Keep stdout clean for pixel data in raw mode
+    std::ostream& info = raw ? std::cerr : std::cout;
     
     // Load image
     cv::Mat img = cv::imread(in, cv::IMREAD_COLOR);
@@ -295,25 +474,19 @@ int main(int argc, char** argv) {
         return 1;
     }
     
-    std::cout << "=== Image Preprocessing Pipeline ===\n";
-    std::cout << "Input: " << in << " (" << img.cols << "x" << img.rows << ")\n";
+    info << "=== Image Preprocessing Pipeline ===\n";
+    info << "Input: " << in << " (" << img.cols << "x" << img.rows << ")\n";
     
     auto start = std::chrono::high_resolution_clock::now();
     
-    ImagePreprocessor processor(true);
+    ImagePreprocessor processor(!raw, info);
     FilterType selectedFilter;
     
     if (autoAssess) {
         selectedFilter = processor.assessImageQuality(img);
     } else {
         // Manual filter selection
-        if (filterStr == "blur") selectedFilter = FilterType::GAUSSIAN_BLUR;
-        else if (filterStr == "sharpen") selectedFilter = FilterType::UNSHARP_MASK;
-        else if (filterStr == "laplacian") selectedFilter = FilterType::LAPLACIAN_SHARPEN;
-        else if (filterStr == "denoise") selectedFilter = FilterType::BILATERAL_DENOISE;
-        else if (filterStr == "clahe") selectedFilter = FilterType::CLAHE_ENHANCE;
-        else if (filterStr == "edge") selectedFilter = FilterType::EDGE_ENHANCE;
-        else selectedFilter = FilterType::GAUSSIAN_BLUR;
+        selectedFilter = parseFilter(filterStr);
     }
     
     // Apply selected filter
@@ -323,6 +496,14 @@ int main(int argc, char** argv) {
     auto duration = std::chrono::duration_cast<std::chrono::milliseconds>(end - start);
     
     // Save result
+    if (raw) {
+        if (!writeRaw(processed)) {
+            std::cerr << "Failed to write raw output\n";
+            return 1;
+        }
+        return 0;
+    }
+    
     if (!cv::imwrite(out, processed)) {
         std::cerr << "Failed to save " << out << "\n";
         return 1;